@@ -1,11 +1,21 @@
 # !/usr/bin/env python3
 from flask import Flask, jsonify, request, Response
-import requests
 import redis
 import logging
-import json
-from jobs import add_job, get_job_by_id, jdb, rd, rdb
+import functools
+import math
+from jobs import (activate_catalog_version, add_job, deactivate_catalog, discard_catalog_version,
+                  get_catalog_version, get_job_by_id, get_job_ids as list_job_ids, get_planet,
+                  get_result as get_job_result, iter_planets, new_catalog_version, pinned_catalog_version,
+                  reclaim_periodically, save_planets, stage_catalog_version, rd)
+from fetch import COLUMNS, CHUNK_SIZE, TAP_URL, batched, fetch_chunks, read_file_chunks, resolve_import_path
+from derived import DERIVED_COLUMNS, add_derived_columns
+from query import (all_of, comparison, filter_rows, order_rows, parse_expression, table_from_records,
+                   table_from_snapshot)
+from snapshot import SnapshotWriter, open_snapshot
+from coalesce import coalesced, counters
 import os
+import time
 
 # Initialize Flask app and redis client
 app = Flask(__name__)
@@ -25,56 +35,181 @@ try:
 except:
     logging.error("Error connecting to Redis!")
 
-# Constants
-URL = "https://exoplanetarchive.ipac.caltech.edu/TAP/sync?query=select+pl_name,hostname,sy_snum,sy_pnum,discoverymethod,disc_year,disc_facility,pl_orbper,pl_orbsmax,pl_rade,pl_bmasse,pl_orbeccen,st_spectype,st_teff,st_rad,st_mass,st_met,st_logg,rastr,decstr,sy_dist,sy_vmag,sy_kmag,sy_gaiamag+from+pscomppars&format=json"
+# Seconds a restore waits for the snapshot's version to finish being reclaimed or built elsewhere
+RESTORE_TIMEOUT = float(os.environ.get('RESTORE_TIMEOUT', 30))
+RESTORE_POLL_INTERVAL = 0.1
 
-def fetch_exoplanet_data() -> list:
+# Map the on-disk snapshot up front so the first requests are served warm
+open_snapshot()
+
+# Sweep catalog versions leaked by crashed loads, readers and jobs
+reclaim_periodically()
+
+# Columns a histogram job can plot
+HISTOGRAM_COLUMNS = [name for name, column_type in COLUMNS.items() if column_type in (int, float)] + \
+                    list(DERIVED_COLUMNS)
+
+def fetch_exoplanet_data(filename: str = None):
     """
-    Fetch exoplanet data from the specified URL.
+    Fetch exoplanet data in chunks, from the NASA Exoplanet Archive or from a local file.
+
+    Args:
+        filename (str): An optional CSV or VOTable file in the import directory to load
+                        instead of querying the archive.
 
     Returns:
-        list: A list of dictionaries representing the exoplanet data. Each dictionary
-              contains information about an exoplanet system.
+        iterator: An iterator over chunks of exoplanet data. Each chunk is a list of
+                  dictionaries containing information about an exoplanet system.
     """
-    try:
-        response = requests.get(URL)
-        response.raise_for_status()
-        data = response.json()
-        logging.debug(f"Received JSON data: {type(data)}")
-        logging.debug(f"Number of exoplanets: {len(data)}")
-        logging.debug(f"First exoplanet data: {data[0]}")
-        return data
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching exoplanet data: {e}")
-        raise
-    except (IndexError, TypeError) as e:
-        logging.error(f"Error accessing data in the JSON response: {e}")
-        raise
+    if filename:
+        path = resolve_import_path(filename)
+        logging.debug(f"Reading exoplanet data from {path}")
+        return read_file_chunks(path)
+    logging.debug(f"Fetching exoplanet data from {TAP_URL}")
+    return fetch_chunks()
+
+def _snapshot_of(version: str):
+    """
+    Return the memory-mapped snapshot if it holds a catalog version with every derived column.
+
+    Snapshots written before a derived column was added lack it, so they are only used
+    for the raw data they hold.
+
+    Args:
+        version (str): The catalog version.
+
+    Returns:
+        Snapshot: The snapshot, or None if it does not hold that version in full.
+    """
+    snapshot = open_snapshot()
+    if snapshot is None or not version or snapshot.version != version:
+        return None
+    if any(name not in snapshot.columns for name in DERIVED_COLUMNS):
+        return None
+    return snapshot
+
+@functools.lru_cache(maxsize=2)
+def _catalog_table(version: str) -> tuple:
+    """
+    Build the columnar table of a catalog version, from the snapshot when it holds that
+    version or from Redis otherwise. Versions never change once built, so the table is
+    cached per version.
+
+    Args:
+        version (str): The catalog version.
+
+    Returns:
+        tuple: The table (column name to Column) and its number of rows.
+    """
+    snapshot = _snapshot_of(version)
+    if snapshot is not None:
+        return table_from_snapshot(snapshot), snapshot.rows
+    exoplanets = sorted(iter_planets(version), key=lambda exoplanet: exoplanet['pl_name'])
+    return table_from_records(exoplanets), len(exoplanets)
 
 @app.route('/data', methods=['POST'])
 def load_data() -> tuple:
     """
-    Load exoplanet data into Redis.
+    Load exoplanet data into Redis, with the derived columns computed for every exoplanet.
+
+    Query Parameters:
+        file (str): An optional CSV or VOTable file in the import directory to load
+                    instead of querying the archive.
 
     Returns:
         tuple: A tuple containing the JSON response and HTTP status code.
     """
     try:
-        exoplanet_data = fetch_exoplanet_data()
-        for exoplanet in exoplanet_data:
-            exoplanet_json = json.dumps(exoplanet)
-            pl_name = exoplanet.get('pl_name')
-            if pl_name:
-                rd.set(pl_name, exoplanet_json)
-            else:
-                logging.warning(f"Skipping exoplanet without 'pl_name': {exoplanet}")
-        logging.info("Data loaded into Redis")
+        # Build the new catalog version in the staging area; readers keep seeing the
+        # active version until it is swapped in at the end
+        version = new_catalog_version()
+        stage_catalog_version(version)
+        writer = SnapshotWriter(version)
+        filename = request.args.get('file')
+        count = 0
+        try:
+            for chunk in fetch_exoplanet_data(filename):
+                planets = []
+                for exoplanet in chunk:
+                    if exoplanet.get('pl_name'):
+                        planets.append(exoplanet)
+                    else:
+                        logging.warning(f"Skipping exoplanet without 'pl_name': {exoplanet}")
+                # Derived columns are computed once here and stored with the raw fields
+                add_derived_columns(planets)
+                writer.add_chunk(planets)
+                save_planets(planets, version)
+                count += len(planets)
+                logging.debug(f"Loaded {count} exoplanets so far")
+            # An empty answer from the archive is a failed fetch, not an empty catalog;
+            # only an explicitly imported file may replace the catalog with nothing
+            if count == 0 and not filename:
+                raise RuntimeError("The Exoplanet Archive returned no exoplanets, keeping the current catalog")
+        except Exception:
+            writer.discard()
+            discard_catalog_version(version)
+            raise
+        try:
+            writer.commit()
+        except OSError as e:
+            logging.warning(f"Unable to write catalog snapshot: {e}")
+        if not activate_catalog_version(version):
+            raise RuntimeError(f"Catalog version {version} expired before it was activated")
+        logging.info(f"Loaded {count} exoplanets into Redis")
         return jsonify({"status": "success", "message": "Data loaded into Redis"}), 200
+    except FileNotFoundError as e:
+        logging.error(f"Error loading data: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ValueError as e:
+        logging.error(f"Error loading data: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         logging.error(f"Error loading data: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/data/restore', methods=['POST'])
+def restore_data() -> tuple:
+    """
+    Reload exoplanet data into Redis from the on-disk snapshot, without calling the archive.
+
+    Returns:
+        tuple: A tuple containing the JSON response and HTTP status code.
+    """
+    try:
+        snapshot = open_snapshot()
+        if snapshot is None:
+            logging.warning("No catalog snapshot available to restore")
+            return jsonify({"status": "error", "message": "No snapshot available"}), 404
+        # After a DELETE /data the snapshot's version is reclaimed in the background; wait
+        # for that to finish and rebuild it rather than failing while it is still busy
+        deadline = time.monotonic() + RESTORE_TIMEOUT
+        while snapshot.version != get_catalog_version():
+            state = stage_catalog_version(snapshot.version)
+            if state == 'staged':
+                try:
+                    derive = any(name not in snapshot.columns for name in DERIVED_COLUMNS)
+                    for chunk in batched(snapshot.records(), CHUNK_SIZE):
+                        if derive:
+                            add_derived_columns(chunk)
+                        save_planets(chunk, snapshot.version)
+                except Exception:
+                    discard_catalog_version(snapshot.version)
+                    raise
+            if state != 'busy' and activate_catalog_version(snapshot.version):
+                break
+            if time.monotonic() >= deadline:
+                logging.warning(f"Snapshot version {snapshot.version} is still being loaded or reclaimed")
+                return jsonify({"status": "error", "message": "Snapshot version is busy, try again later"}), 409
+            time.sleep(RESTORE_POLL_INTERVAL)
+        logging.info(f"Restored {snapshot.rows} exoplanets from snapshot {snapshot.version}")
+        return jsonify({"status": "success", "message": "Data restored from snapshot",
+                        "version": snapshot.version, "count": snapshot.rows}), 200
+    except Exception as e:
+        logging.error(f"Error restoring data: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/data', methods=['GET'])
+@coalesced()
 def get_data() -> tuple:
     """
     Retrieve exoplanet data from Redis.
@@ -83,12 +218,13 @@ def get_data() -> tuple:
         tuple: A tuple containing the JSON response and HTTP status code.
     """
     try:
-        keys = rd.keys('*')
-        data = []
-        for key in keys:
-            exoplanet_json = rd.get(key)
-            exoplanet_data = json.loads(exoplanet_json)
-            data.append(exoplanet_data)
+        snapshot = _snapshot_of(get_catalog_version())
+        if snapshot is not None:
+            data = list(snapshot.records())
+            logging.info(f"Data retrieved from snapshot {snapshot.version}")
+            return jsonify(data), 200
+
+        data = list(iter_planets())
         logging.info("Data retrieved from Redis")
         return jsonify(data), 200
     except Exception as e:
@@ -104,7 +240,7 @@ def delete_data() -> tuple:
         tuple: A tuple containing the JSON response and HTTP status code.
     """
     try:
-        rd.flushdb()
+        deactivate_catalog()
         logging.info("Data deleted from Redis")
         return jsonify({"status": "success", "message": "Data deleted from Redis"}), 200
     except Exception as e:
@@ -112,11 +248,20 @@ def delete_data() -> tuple:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/exoplanets', methods=['GET'])
+@coalesced()
 def get_exoplanet_names() -> tuple:
     """
     Retrieve exoplanets based on query parameters.
 
     Query Parameters:
+        where (str): A filter expression over any catalog or derived column, e.g.
+                     "pl_orbper < 10 AND pl_in_hz = TRUE". Supports =, !=, <, <=, >, >=,
+                     IS [NOT] NULL, [NOT] IN (...), AND, OR, NOT and parentheses.
+                     Comparisons with a null value never match.
+        order_by (str): Columns to sort by, each optionally followed by ASC or DESC,
+                        e.g. "pl_rade DESC, pl_name". Nulls sort last.
+        limit (int): The maximum number of exoplanets to return.
+        offset (int): The number of exoplanets to skip.
         min_radius (float): The minimum radius value in Earth radii.
         max_radius (float): The maximum radius value in Earth radii.
         method (str): The discovery method.
@@ -127,37 +272,47 @@ def get_exoplanet_names() -> tuple:
         tuple: A tuple containing the JSON response and HTTP status code.
     """
     try:
+        where = request.args.get('where')
+        order_by = request.args.get('order_by')
+        limit = request.args.get('limit')
+        offset = int(request.args.get('offset', 0))
         min_radius = float(request.args.get('min_radius', 0))
         max_radius = float(request.args.get('max_radius', float('inf')))
         method = request.args.get('method')
         start_year = request.args.get('start_year')
         end_year = request.args.get('end_year')
 
+        if limit is not None:
+            limit = int(limit)
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("limit and offset must not be negative")
+
+        filters = [parse_expression(where)] if where else []
+        # Without a where expression only planets with a known radius are listed
+        if 'min_radius' in request.args or not where:
+            filters.append(comparison('pl_rade', '>=', min_radius))
+        if 'max_radius' in request.args or not where:
+            filters.append(comparison('pl_rade', '<=', max_radius))
+        if method:
+            filters.append(comparison('discoverymethod', '=', method))
         if start_year:
-            start_year = int(start_year)
+            filters.append(comparison('disc_year', '>=', int(start_year)))
         if end_year:
-            end_year = int(end_year)
+            filters.append(comparison('disc_year', '<=', int(end_year)))
 
         exoplanet_names = []
-        for key in rd.keys():
-            exoplanet_json = rd.get(key)
-            if exoplanet_json:
-                exoplanet = json.loads(exoplanet_json)
-                radius = exoplanet.get('pl_rade')
-                discovery_method = exoplanet.get('discoverymethod')
-                discovery_year = exoplanet.get('disc_year')
-
-                if radius is not None and min_radius <= radius <= max_radius:
-                    if method is None or method == discovery_method:
-                        if start_year is None or (start_year and discovery_year >= start_year):
-                            if end_year is None or (end_year and discovery_year <= end_year):
-                                exoplanet_names.append(exoplanet['pl_name'])
+        with pinned_catalog_version() as version:
+            if version:
+                table, rows = _catalog_table(version)
+                indices = filter_rows(all_of(*filters), table, rows)
+                indices = order_rows(indices, order_by, table, limit, offset)
+                exoplanet_names = table['pl_name'].values[indices].tolist()
 
         logging.info(f"Retrieved {len(exoplanet_names)} exoplanets")
         return jsonify(exoplanet_names), 200
     except ValueError as e:
         logging.error(f"Invalid query parameter: {e}")
-        return jsonify({"status": "error", "message": "Invalid query parameter"}), 400
+        return jsonify({"status": "error", "message": f"Invalid query parameter: {e}"}), 400
     except Exception as e:
         logging.error(f"Error retrieving exoplanets: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -174,9 +329,8 @@ def get_exoplanet_data(pl_name: str) -> tuple:
         tuple: A tuple containing the JSON response and HTTP status code.
     """
     try:
-        exoplanet_json = rd.get(pl_name)
-        if exoplanet_json:
-            exoplanet_data = json.loads(exoplanet_json)
+        exoplanet_data = get_planet(pl_name)
+        if exoplanet_data:
             logging.info(f"Exoplanet data retrieved for {pl_name}")
             return jsonify(exoplanet_data), 200
         else:
@@ -187,6 +341,7 @@ def get_exoplanet_data(pl_name: str) -> tuple:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/hosts', methods=['GET'])
+@coalesced()
 def get_host_stars() -> tuple:
     """
     Retrieve all unique host stars from the exoplanet data.
@@ -196,13 +351,10 @@ def get_host_stars() -> tuple:
     """
     try:
         host_stars = set()
-        for key in rd.keys():
-            exoplanet_json = rd.get(key)
-            if exoplanet_json:
-                exoplanet = json.loads(exoplanet_json)
-                hostname = exoplanet.get('hostname')
-                if hostname:
-                    host_stars.add(hostname)
+        for exoplanet in iter_planets():
+            hostname = exoplanet.get('hostname')
+            if hostname:
+                host_stars.add(hostname)
 
         host_stars_list = list(host_stars)
         logging.info(f"Retrieved {len(host_stars_list)} unique host stars")
@@ -212,6 +364,7 @@ def get_host_stars() -> tuple:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/hosts/<hostname>', methods=['GET'])
+@coalesced()
 def get_planets_by_hostname(hostname: str) -> tuple:
     """
     Retrieve all planets associated with a given host star.
@@ -224,12 +377,9 @@ def get_planets_by_hostname(hostname: str) -> tuple:
     """
     try:
         exoplanet_names = []
-        for key in rd.keys():
-            exoplanet_json = rd.get(key)
-            if exoplanet_json:
-                exoplanet = json.loads(exoplanet_json)
-                if exoplanet.get('hostname') == hostname:
-                    exoplanet_names.append(exoplanet['pl_name'])
+        for exoplanet in iter_planets():
+            if exoplanet.get('hostname') == hostname:
+                exoplanet_names.append(exoplanet['pl_name'])
 
         if exoplanet_names:
             host_data = {
@@ -247,6 +397,7 @@ def get_planets_by_hostname(hostname: str) -> tuple:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/facilities', methods=['GET'])
+@coalesced()
 def get_facilities() -> tuple:
     """
     Retrieve all unique discovery facilities.
@@ -256,13 +407,10 @@ def get_facilities() -> tuple:
     """
     try:
         facilities = set()
-        for key in rd.keys():
-            exoplanet_json = rd.get(key)
-            if exoplanet_json:
-                exoplanet = json.loads(exoplanet_json)
-                facility = exoplanet.get('disc_facility')
-                if facility:
-                    facilities.add(facility)
+        for exoplanet in iter_planets():
+            facility = exoplanet.get('disc_facility')
+            if facility:
+                facilities.add(facility)
 
         facilities_list = list(facilities)
         logging.info(f"Retrieved {len(facilities_list)} unique discovery facilities")
@@ -272,6 +420,7 @@ def get_facilities() -> tuple:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/facilities/<facility_name>', methods=['GET'])
+@coalesced()
 def get_planets_by_facility(facility_name: str) -> tuple:
     """
     Retrieve all planets discovered by a specific facility.
@@ -284,13 +433,10 @@ def get_planets_by_facility(facility_name: str) -> tuple:
     """
     try:
         exoplanet_names = []
-        for key in rd.keys():
-            exoplanet_json = rd.get(key)
-            if exoplanet_json:
-                exoplanet = json.loads(exoplanet_json)
-                facility = exoplanet.get('disc_facility')
-                if facility == facility_name:
-                    exoplanet_names.append(exoplanet['pl_name'])
+        for exoplanet in iter_planets():
+            facility = exoplanet.get('disc_facility')
+            if facility == facility_name:
+                exoplanet_names.append(exoplanet['pl_name'])
 
         logging.info(f"Retrieved {len(exoplanet_names)} exoplanets discovered by {facility_name}")
         return jsonify(exoplanet_names), 200
@@ -301,7 +447,11 @@ def get_planets_by_facility(facility_name: str) -> tuple:
 @app.route('/jobs', methods=['POST'])
 def submit_route() -> tuple:
     """
-    Submit a job to plot the histogram of planet size distribution.
+    Submit a job to plot the histogram of a numeric column, by default the planet size distribution.
+
+    JSON Body:
+        bin_size (float): The histogram bin size (default: 1.0).
+        column (str): The catalog or derived column to plot (default: 'pl_rade').
 
     Returns:
         tuple: A tuple containing the JSON response and HTTP status code.
@@ -309,7 +459,18 @@ def submit_route() -> tuple:
     data = request.get_json()
     logging.debug(f"Received JSON data: {data}")
     bin_size = data.get('bin_size', 1.0)  # Default bin size is 1.0
-    job_dict = add_job(bin_size)
+    column = data.get('column', 'pl_rade')
+    try:
+        bin_size = float(bin_size)
+    except (TypeError, ValueError):
+        bin_size = None
+    if bin_size is None or not math.isfinite(bin_size) or bin_size <= 0:
+        logging.warning(f"Invalid bin size: {data.get('bin_size')}")
+        return jsonify({"status": "error", "message": "bin_size must be a positive number"}), 400
+    if column not in HISTOGRAM_COLUMNS:
+        logging.warning(f"Invalid histogram column: {column}")
+        return jsonify({"status": "error", "message": f"Invalid column: {column}"}), 400
+    job_dict = add_job(bin_size, column)
     logging.debug(f"Job added: {job_dict}")
     return job_dict, 200
 
@@ -321,8 +482,7 @@ def get_job_ids() -> tuple:
     Returns:
         tuple: A tuple containing the JSON response and HTTP status code.
     """
-    job_ids = jdb.keys("*")
-    job_ids = [job_id.decode('utf-8') for job_id in job_ids]
+    job_ids = list_job_ids()
     logging.debug(f"Retrieved job IDs: {job_ids}")
     return jsonify(job_ids), 200
 
@@ -358,7 +518,7 @@ def get_result(jobid: str) -> tuple:
         if job:
             job_status = job['status']
             if job_status == 'complete':
-                plot_data = rdb.get(jobid)
+                plot_data = get_job_result(jobid)
                 if plot_data:
                     return Response(plot_data, mimetype='image/png'), 200
                 else:
@@ -373,6 +533,16 @@ def get_result(jobid: str) -> tuple:
         logging.error(f"Error retrieving result for job {jobid}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/stats', methods=['GET'])
+def get_stats() -> tuple:
+    """
+    Retrieve the number of admitted, coalesced and shed requests for each expensive route.
+
+    Returns:
+        tuple: A tuple containing the JSON response and HTTP status code.
+    """
+    return jsonify(counters.snapshot()), 200
+
 @app.route('/help', methods=['GET'])
 def show_routes() -> tuple:
     """
@@ -0,0 +1,154 @@
+from flask import Response, current_app, jsonify, request
+import functools
+import logging
+import os
+import threading
+
+# Configure logging
+log_level = os.environ.get('LOG_LEVEL', 'WARNING')
+logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants
+ADMISSION_LIMIT = int(os.environ.get('ADMISSION_LIMIT', 4))
+RETRY_AFTER = int(os.environ.get('RETRY_AFTER', 1))
+
+class _Shed(Exception):
+    """
+    Raised when a computation is refused because its route is at its concurrency limit.
+    """
+
+class _Call:
+    """
+    One in-flight computation and the outcome shared with every caller waiting on it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Run at most one computation per key at a time; concurrent callers with the same key
+    wait for the running computation and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, compute) -> tuple:
+        """
+        Run `compute`, or wait for the identical computation that is already running.
+
+        Args:
+            key: The key identifying identical computations.
+            compute (callable): The computation.
+
+        Returns:
+            tuple: The result and whether it was shared from another caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = compute()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+class Counters:
+    """
+    Thread-safe per-route counters of admitted, coalesced and shed requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def increment(self, route: str, name: str) -> None:
+        """
+        Increment one counter of a route.
+
+        Args:
+            route (str): The route.
+            name (str): The counter ('admitted', 'coalesced' or 'shed').
+        """
+        with self._lock:
+            counts = self._counts.setdefault(route, {'admitted': 0, 'coalesced': 0, 'shed': 0})
+            counts[name] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Return a copy of all counters.
+
+        Returns:
+            dict: Route to counter name to count.
+        """
+        with self._lock:
+            return {route: dict(counts) for route, counts in self._counts.items()}
+
+flights = SingleFlight()
+counters = Counters()
+
+def coalesced(max_concurrent: int = ADMISSION_LIMIT, retry_after: int = RETRY_AFTER):
+    """
+    Decorate an expensive Flask view with request coalescing and admission control.
+
+    Concurrent requests for the same method, path and query string share one call of
+    the view and one serialized response body. At most `max_concurrent` distinct calls
+    of the view run at once; beyond that, requests are shed with 503 and a Retry-After
+    header instead of queueing.
+
+    Args:
+        max_concurrent (int): The maximum number of concurrent calls of the view.
+        retry_after (int): The number of seconds clients are asked to wait when shed.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(view):
+        semaphore = threading.BoundedSemaphore(max_concurrent)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            route = request.url_rule.rule
+
+            def compute() -> tuple:
+                if not semaphore.acquire(blocking=False):
+                    raise _Shed()
+                try:
+                    counters.increment(route, 'admitted')
+                    response = current_app.make_response(view(*args, **kwargs))
+                    return response.get_data(), response.status_code, response.mimetype
+                finally:
+                    semaphore.release()
+
+            try:
+                (body, status, mimetype), shared = flights.do((view.__name__, request.method, request.full_path), compute)
+            except _Shed:
+                counters.increment(route, 'shed')
+                logging.warning(f"Shedding request to {request.full_path}: {route} is at its concurrency limit")
+                response = jsonify({"status": "error", "message": "Server busy, try again later"})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            if shared:
+                counters.increment(route, 'coalesced')
+            return Response(body, status=status, mimetype=mimetype)
+        return wrapper
+    return decorator
@@ -0,0 +1,141 @@
+import logging
+import os
+import numpy as np
+
+# Configure logging
+log_level = os.environ.get('LOG_LEVEL', 'WARNING')
+logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants
+SOLAR_RADIUS_AU = 0.00465047
+SOLAR_TEFF = 5772.0
+EARTH_DENSITY = 5.514  # g/cm^3
+
+# Habitable zone limits in effective stellar flux, from Kopparapu et al. (2014):
+# S_eff = S_eff_sun + a*T + b*T^2 + c*T^3 + d*T^4 with T = T_eff - 5780 K,
+# valid for 2600 K <= T_eff <= 7200 K
+HZ_RUNAWAY_GREENHOUSE = (1.107, 1.332e-4, 1.580e-8, -8.308e-12, -1.931e-15)
+HZ_MAXIMUM_GREENHOUSE = (0.356, 6.171e-5, 1.698e-9, -3.198e-12, -5.575e-16)
+HZ_TEFF_RANGE = (2600.0, 7200.0)
+
+# Registered derived columns: name -> (function, input columns, description, is_flag)
+DERIVED_COLUMNS = {}
+
+def derived(name: str, description: str, *inputs: str, flag: bool = False):
+    """
+    Register a function computing a derived column from catalog columns.
+
+    The function receives one float64 array per input column, with NaN for missing
+    values, and returns an array of the same length with NaN where the result is unknown.
+
+    Args:
+        name (str): The name of the derived column.
+        description (str): A human-readable description, used e.g. as a plot label.
+        *inputs (str): The names of the input columns.
+        flag (bool): Whether the column is a true/false flag (results 1.0 and 0.0).
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        DERIVED_COLUMNS[name] = (func, inputs, description, flag)
+        return func
+    return decorator
+
+@derived('pl_insol_calc', 'Insolation Flux (Earth Flux)', 'st_rad', 'st_teff', 'pl_orbsmax')
+def insolation_flux(st_rad: np.ndarray, st_teff: np.ndarray, pl_orbsmax: np.ndarray) -> np.ndarray:
+    """
+    Stellar flux received by the planet relative to the flux received by Earth.
+    """
+    return st_rad ** 2 * (st_teff / SOLAR_TEFF) ** 4 / pl_orbsmax ** 2
+
+@derived('pl_eqt_calc', 'Equilibrium Temperature (K)', 'st_teff', 'st_rad', 'pl_orbsmax')
+def equilibrium_temperature(st_teff: np.ndarray, st_rad: np.ndarray, pl_orbsmax: np.ndarray) -> np.ndarray:
+    """
+    Planetary equilibrium temperature, assuming zero albedo and full heat redistribution.
+    """
+    return st_teff * np.sqrt(st_rad * SOLAR_RADIUS_AU / (2 * pl_orbsmax))
+
+@derived('pl_dens_calc', 'Bulk Density (g/cm^3)', 'pl_bmasse', 'pl_rade')
+def bulk_density(pl_bmasse: np.ndarray, pl_rade: np.ndarray) -> np.ndarray:
+    """
+    Planetary bulk density from mass and radius in Earth units.
+    """
+    return EARTH_DENSITY * pl_bmasse / pl_rade ** 3
+
+def _effective_flux(coefficients: tuple, st_teff: np.ndarray) -> np.ndarray:
+    """
+    Evaluate a Kopparapu et al. (2014) habitable zone flux limit.
+
+    Args:
+        coefficients (tuple): S_eff_sun, a, b, c and d.
+        st_teff (np.ndarray): The stellar effective temperatures in Kelvin.
+
+    Returns:
+        np.ndarray: The flux limit relative to Earth's insolation.
+    """
+    s_eff_sun, a, b, c, d = coefficients
+    t = st_teff - 5780.0
+    return s_eff_sun + a * t + b * t ** 2 + c * t ** 3 + d * t ** 4
+
+@derived('pl_in_hz', 'Habitable Zone Membership', 'st_rad', 'st_teff', 'pl_orbsmax', flag=True)
+def habitable_zone(st_rad: np.ndarray, st_teff: np.ndarray, pl_orbsmax: np.ndarray) -> np.ndarray:
+    """
+    Whether the planet lies within the conservative habitable zone (1.0 or 0.0), or NaN
+    when the flux is unknown or the star is outside the range the limits are fitted for.
+    """
+    flux = insolation_flux(st_rad, st_teff, pl_orbsmax)
+    inside = (flux <= _effective_flux(HZ_RUNAWAY_GREENHOUSE, st_teff)) & \
+             (flux >= _effective_flux(HZ_MAXIMUM_GREENHOUSE, st_teff))
+    valid = np.isfinite(flux) & (st_teff >= HZ_TEFF_RANGE[0]) & (st_teff <= HZ_TEFF_RANGE[1])
+    return np.where(valid, inside.astype(np.float64), np.nan)
+
+def _input_array(records: list, name: str) -> np.ndarray:
+    """
+    Gather one numeric input column from a batch of records.
+
+    Args:
+        records (list): The exoplanet records.
+        name (str): The column name.
+
+    Returns:
+        np.ndarray: The values as float64, with NaN for missing or non-numeric values.
+    """
+    return np.array([value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                     for value in (record.get(name) for record in records)], dtype=np.float64)
+
+def add_derived_columns(records: list) -> list:
+    """
+    Compute every registered derived column for a batch of records in one vectorized
+    pass and store the results in the records.
+
+    Values that cannot be computed (missing inputs, division by zero) are stored as None.
+
+    Args:
+        records (list): The exoplanet records, updated in place.
+
+    Returns:
+        list: The same records.
+    """
+    if not records:
+        return records
+    inputs = {}
+    results = {}
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for name, (func, columns, _, _) in DERIVED_COLUMNS.items():
+            for column in columns:
+                if column not in inputs:
+                    inputs[column] = _input_array(records, column)
+            values = np.asarray(func(*(inputs[column] for column in columns)), dtype=np.float64)
+            values[~np.isfinite(values)] = np.nan
+            results[name] = values.tolist()
+
+    for name, values in results.items():
+        if DERIVED_COLUMNS[name][3]:
+            values = [None if value != value else bool(value) for value in values]
+        else:
+            values = [None if value != value else value for value in values]
+        for record, value in zip(records, values):
+            record[name] = value
+    logging.debug(f"Computed {len(results)} derived columns for {len(records)} exoplanets")
+    return records
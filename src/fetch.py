@@ -0,0 +1,265 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import csv
+import logging
+import os
+import time
+import xml.etree.ElementTree as ET
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configure logging
+log_level = os.environ.get('LOG_LEVEL', 'WARNING')
+logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants
+TAP_URL = "https://exoplanetarchive.ipac.caltech.edu/TAP/sync"
+TABLE = "pscomppars"
+COLUMNS = {
+    'pl_name': str, 'hostname': str, 'sy_snum': int, 'sy_pnum': int, 'discoverymethod': str,
+    'disc_year': int, 'disc_facility': str, 'pl_orbper': float, 'pl_orbsmax': float,
+    'pl_rade': float, 'pl_bmasse': float, 'pl_orbeccen': float, 'st_spectype': str,
+    'st_teff': float, 'st_rad': float, 'st_mass': float, 'st_met': float, 'st_logg': float,
+    'rastr': str, 'decstr': str, 'sy_dist': float, 'sy_vmag': float, 'sy_kmag': float,
+    'sy_gaiamag': float,
+}
+CHUNK_SIZE = int(os.environ.get('FETCH_CHUNK_SIZE', 1000))
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 4))
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 3))
+FETCH_BACKOFF = float(os.environ.get('FETCH_BACKOFF', 0.5))
+FETCH_TIMEOUT = (float(os.environ.get('FETCH_CONNECT_TIMEOUT', 5)),
+                 float(os.environ.get('FETCH_READ_TIMEOUT', 60)))
+IMPORT_DIR = os.environ.get('IMPORT_DIR', 'data')
+
+# VOTable datatypes mapped to the Python type used to parse their cells
+VOTABLE_TYPES = {
+    'boolean': str, 'char': str, 'unicodeChar': str,
+    'short': int, 'int': int, 'long': int, 'unsignedByte': int,
+    'float': float, 'double': float,
+}
+
+def _convert(value: str, column_type: type):
+    """
+    Convert a raw text cell into its Python value.
+
+    Args:
+        value (str): The cell text.
+        column_type (type): The type of the column (str, int or float).
+
+    Returns:
+        The converted value, or None for an empty cell.
+    """
+    if value is None or value == '':
+        return None
+    if column_type is int:
+        return int(float(value)) if '.' in value or 'e' in value.lower() else int(value)
+    return column_type(value)
+
+def _parse_csv(lines, column_types: dict = COLUMNS):
+    """
+    Incrementally parse CSV lines into exoplanet records.
+
+    Args:
+        lines (iterable): The CSV lines, starting with the header row.
+        column_types (dict): The type of each known column; unknown columns are kept as text.
+
+    Yields:
+        dict: One exoplanet record per data row.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    types = [column_types.get(name, str) for name in header]
+    for row in reader:
+        if row:
+            yield {name: _convert(value, column_type) for name, value, column_type in zip(header, row, types)}
+
+def _parse_votable(source):
+    """
+    Incrementally parse a VOTable (TABLEDATA serialization) into exoplanet records.
+
+    Args:
+        source: A path or binary file object containing the VOTable XML.
+
+    Yields:
+        dict: One exoplanet record per table row.
+    """
+    names, types = [], []
+    for event, element in ET.iterparse(source, events=('end',)):
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 'FIELD':
+            names.append(element.get('name'))
+            types.append(VOTABLE_TYPES.get(element.get('datatype'), str))
+        elif tag == 'TR':
+            cells = [td.text for td in element if td.tag.rsplit('}', 1)[-1] == 'TD']
+            yield {name: _convert(value, column_type) for name, value, column_type in zip(names, cells, types)}
+            element.clear()
+        elif tag in ('BINARY', 'BINARY2', 'FITS'):
+            raise ValueError("Only TABLEDATA VOTables are supported")
+
+def batched(records, chunk_size: int):
+    """
+    Group an iterable of records into lists of at most `chunk_size` records.
+
+    Args:
+        records (iterable): The records to group.
+        chunk_size (int): The maximum number of records per chunk.
+
+    Yields:
+        list: The next chunk of records.
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _make_session(pool_size: int = FETCH_WORKERS) -> requests.Session:
+    """
+    Create an HTTP session whose connection pool is shared by all chunk fetches.
+
+    Args:
+        pool_size (int): The number of pooled connections to keep open.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def _query(session: requests.Session, adql: str):
+    """
+    Run an ADQL query against the TAP service and stream back CSV records.
+
+    The request is retried with exponential backoff on connection errors, timeouts and
+    error responses. The response body is parsed as it arrives and never held in full.
+
+    Args:
+        session (requests.Session): The pooled HTTP session.
+        adql (str): The ADQL query.
+
+    Returns:
+        list: The parsed records.
+    """
+    params = {'query': adql, 'format': 'csv'}
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            with session.get(TAP_URL, params=params, timeout=FETCH_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                response.encoding = 'utf-8'
+                return list(_parse_csv(response.iter_lines(decode_unicode=True)))
+        except requests.exceptions.RequestException as e:
+            if attempt == FETCH_RETRIES:
+                raise
+            delay = FETCH_BACKOFF * 2 ** attempt
+            logging.warning(f"TAP query failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def count_rows(session: requests.Session) -> int:
+    """
+    Return the number of rows in the exoplanet table.
+
+    Args:
+        session (requests.Session): The pooled HTTP session.
+
+    Returns:
+        int: The row count.
+    """
+    rows = _query(session, f"select count(*) as n from {TABLE}")
+    return int(rows[0]['n'])
+
+def _fetch_range(session: requests.Session, offset: int, limit: int) -> list:
+    """
+    Fetch one row range of the exoplanet table.
+
+    Args:
+        session (requests.Session): The pooled HTTP session.
+        offset (int): The index of the first row.
+        limit (int): The maximum number of rows.
+
+    Returns:
+        list: The exoplanet records in the range.
+    """
+    adql = (f"select top {limit} {','.join(COLUMNS)} from {TABLE} "
+            f"order by pl_name offset {offset}")
+    chunk = _query(session, adql)
+    logging.debug(f"Fetched {len(chunk)} exoplanets at offset {offset}")
+    return chunk
+
+def fetch_chunks(chunk_size: int = CHUNK_SIZE, workers: int = FETCH_WORKERS):
+    """
+    Fetch the exoplanet table from the TAP service as concurrently fetched row ranges.
+
+    At most `workers` ranges are in flight at once, so peak memory is bounded by
+    `workers * chunk_size` rows regardless of the size of the catalog.
+
+    Args:
+        chunk_size (int): The number of rows per range.
+        workers (int): The number of ranges fetched concurrently.
+
+    Yields:
+        list: The next chunk of exoplanet records, in table order.
+    """
+    with _make_session(workers) as session:
+        total = count_rows(session)
+        logging.debug(f"Fetching {total} exoplanets in chunks of {chunk_size}")
+        offsets = iter(range(0, total, chunk_size))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = [executor.submit(_fetch_range, session, offset, chunk_size)
+                       for offset in islice(offsets, workers)]
+            while pending:
+                chunk = pending.pop(0).result()
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(executor.submit(_fetch_range, session, offset, chunk_size))
+                yield chunk
+
+def resolve_import_path(filename: str) -> str:
+    """
+    Resolve a file name inside the import directory.
+
+    Args:
+        filename (str): The file name, relative to IMPORT_DIR.
+
+    Returns:
+        str: The absolute path of the file.
+
+    Raises:
+        ValueError: If the path escapes the import directory.
+        FileNotFoundError: If the file does not exist.
+    """
+    root = os.path.realpath(IMPORT_DIR)
+    path = os.path.realpath(os.path.join(root, filename))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"File must be inside the import directory: {filename}")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"File not found: {filename}")
+    return path
+
+def read_file_chunks(path: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Read exoplanet records from a local CSV or VOTable file, for loads without network access.
+
+    Args:
+        path (str): The path of a .csv, .xml, .vot or .votable file.
+        chunk_size (int): The number of rows per chunk.
+
+    Yields:
+        list: The next chunk of exoplanet records.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from batched(_parse_csv(f), chunk_size)
+    elif extension in ('.xml', '.vot', '.votable'):
+        with open(path, 'rb') as f:
+            yield from batched(_parse_votable(f), chunk_size)
+    else:
+        raise ValueError(f"Unsupported file format: {extension}")
@@ -1,22 +1,234 @@
+import contextlib
+import functools
 import json
 import uuid
 import redis
-from hotqueue import HotQueue
+from redis.cluster import RedisCluster
 import os
 import logging
+import threading
+import time
 
 # Environment variables
 redis_host= os.environ.get('REDIS_HOST')
 redis_port= os.environ.get('REDIS_PORT')
+redis_cluster = os.environ.get('REDIS_CLUSTER', 'false').lower() in ('1', 'true', 'yes')
 
 # Configure logging
 log_level = os.environ.get('LOG_LEVEL', 'WARNING')
 logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
 
-rd = redis.Redis(host=redis_host, port=redis_port, db=0)
-q = HotQueue("queue", host=redis_host, port=redis_port, db=1)
-jdb = redis.Redis(host=redis_host, port=redis_port, db=2)
-rdb = redis.Redis(host=redis_host, port=redis_port, db=3)
+# Key layout. Every key of a family shares a hash tag, so the family lives in a single
+# cluster slot and multi-key commands (MGET, pipelines) on it work in cluster mode.
+CATALOG_VERSION = '{catalog}:version'
+CATALOG_VERSIONS = '{catalog}:versions'
+CATALOG_STAGING = '{catalog}:staging'
+CATALOG_RECLAIMING = '{catalog}:reclaiming'
+CATALOG_PINS = '{catalog}:pins'
+CATALOG_PIN_DEADLINES = '{catalog}:pin_deadlines'
+QUEUE_KEY = '{queue}:jobs'
+JOB_INDEX = '{jobs}:index'
+CATALOG_BATCH_SIZE = 500
+
+# Leases, in seconds. A process that dies while pinning, building or reclaiming a catalog
+# version leaves its entry behind; once the lease runs out the reclaimer sweeps it.
+STAGING_TTL = float(os.environ.get('CATALOG_STAGING_TTL', 600))
+RECLAIM_TTL = float(os.environ.get('CATALOG_RECLAIM_TTL', 600))
+PIN_TTL = float(os.environ.get('CATALOG_PIN_TTL', 300))
+JOB_PIN_TTL = float(os.environ.get('JOB_PIN_TTL', 86400))
+RECLAIM_INTERVAL = float(os.environ.get('CATALOG_RECLAIM_INTERVAL', 60))
+
+def catalog_key(pl_name: str, version: str) -> str:
+    """
+    Return the key holding an exoplanet record.
+
+    Args:
+        pl_name (str): The name of the exoplanet.
+        version (str): The catalog version.
+
+    Returns:
+        str: The Redis key.
+    """
+    return f'{{catalog}}:{version}:planet:{pl_name}'
+
+def catalog_index_key(version: str) -> str:
+    """
+    Return the key of the set of exoplanet names in a catalog version.
+
+    Args:
+        version (str): The catalog version.
+
+    Returns:
+        str: The Redis key.
+    """
+    return f'{{catalog}}:{version}:index'
+
+def job_key(jid: str) -> str:
+    """
+    Return the key holding a job description.
+
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        str: The Redis key.
+    """
+    return f'{{jobs}}:job:{jid}'
+
+def result_key(jid: str) -> str:
+    """
+    Return the key holding the result of a job.
+
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        str: The Redis key.
+    """
+    return f'{{results}}:{jid}'
+
+def _connect():
+    """
+    Create the Redis client, for either a single node or a cluster.
+
+    Returns:
+        The Redis or RedisCluster client.
+    """
+    if redis_cluster:
+        return RedisCluster(host=redis_host, port=redis_port)
+    return redis.Redis(host=redis_host, port=redis_port, db=0)
+
+class JobQueue:
+    """
+    A FIFO queue of job IDs stored in a single Redis list.
+
+    It replaces HotQueue, which always opens its own single-node connection and so
+    cannot be used against a cluster.
+    """
+
+    def __init__(self, client, key: str):
+        """
+        Args:
+            client: The Redis client.
+            key (str): The key of the list backing the queue.
+        """
+        self.client = client
+        self.key = key
+
+    def put(self, jid: str) -> None:
+        """
+        Append a job ID to the queue.
+
+        Args:
+            jid (str): The job ID.
+        """
+        self.client.rpush(self.key, jid)
+
+    def get(self, timeout: int = 0) -> str:
+        """
+        Pop the next job ID, blocking until one is available.
+
+        Args:
+            timeout (int): The number of seconds to wait, or 0 to wait forever.
+
+        Returns:
+            str: The job ID, or None if the timeout expired.
+        """
+        item = self.client.blpop([self.key], timeout=timeout)
+        return item[1].decode('utf-8') if item else None
+
+    def __len__(self) -> int:
+        return self.client.llen(self.key)
+
+    def worker(self, func):
+        """
+        Decorate a function so that calling it consumes the queue forever,
+        passing each job ID to the function.
+
+        Args:
+            func (callable): The function processing one job ID.
+
+        Returns:
+            callable: The consuming loop.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            while True:
+                jid = self.get()
+                if jid is not None:
+                    func(jid, *args, **kwargs)
+        return wrapper
+
+rd = _connect()
+q = JobQueue(rd, QUEUE_KEY)
+
+# Catalog version bookkeeping runs as Lua scripts so that each check-and-set is atomic.
+# A version is staged while it is built, then moves to the set of complete versions;
+# versions that are neither active nor pinned move on to be reclaimed. Staging and
+# reclaiming entries are sorted sets scored by the deadline of their lease, and each pinned
+# version records the deadline of its latest pin.
+_stage_script = rd.register_script("""
+if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then return 'ready' end
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('ZSCORE', KEYS[3], ARGV[1]) then
+    return 'busy'
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+return 'staged'
+""")
+_activate_script = rd.register_script("""
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 1 then
+    redis.call('SADD', KEYS[3], ARGV[1])
+elseif redis.call('SISMEMBER', KEYS[3], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1])
+return 1
+""")
+_pin_script = rd.register_script("""
+local version = ARGV[1]
+if version == '' then version = redis.call('GET', KEYS[1]) end
+if not version or redis.call('SISMEMBER', KEYS[2], version) == 0 then return false end
+redis.call('HINCRBY', KEYS[3], version, 1)
+local deadline = tonumber(redis.call('ZSCORE', KEYS[4], version))
+if not deadline or deadline < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[4], ARGV[2], version)
+end
+return version
+""")
+_unpin_script = rd.register_script("""
+local pins = redis.call('HINCRBY', KEYS[2], ARGV[1], -1)
+if pins > 0 then return 0 end
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+if redis.call('GET', KEYS[1]) == ARGV[1] then return 0 end
+return 1
+""")
+_retire_script = rd.register_script("""
+local now, deadline = ARGV[1], ARGV[2]
+for _, version in ipairs(redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', now)) do
+    redis.call('HDEL', KEYS[3], version)
+    redis.call('ZREM', KEYS[5], version)
+end
+local retired = {}
+for _, version in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', now)) do
+    redis.call('ZREM', KEYS[4], version)
+    table.insert(retired, version)
+end
+for _, version in ipairs(redis.call('ZRANGEBYSCORE', KEYS[6], '-inf', now)) do
+    table.insert(retired, version)
+end
+local active = redis.call('GET', KEYS[1])
+for _, version in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    if version ~= active and not redis.call('HGET', KEYS[3], version) then
+        redis.call('SREM', KEYS[2], version)
+        table.insert(retired, version)
+    end
+end
+for _, version in ipairs(retired) do
+    redis.call('ZADD', KEYS[6], deadline, version)
+end
+return retired
+""")
 
 def _generate_jid() -> str:
     """
@@ -27,7 +239,7 @@ def _generate_jid() -> str:
     """
     return str(uuid.uuid4())
 
-def _instantiate_job(jid: str, status: str, bin_size: float) -> dict:
+def _instantiate_job(jid: str, status: str, bin_size: float, column: str, version: str) -> dict:
     """
     Create the job object description as a python dictionary.
 
@@ -36,13 +248,17 @@ def _instantiate_job(jid: str, status: str, bin_size: float) -> dict:
         status (str): The status of the job.
         start (int): The start value for the job.
         end (int): The end value for the job.
+        column (str): The column to plot.
+        version (str): The catalog version the job runs against.
 
     Returns:
         dict: The job object description.
     """
     return {'id': jid,
             'status': status,
-            'bin_size': bin_size}
+            'bin_size': bin_size,
+            'column': column,
+            'version': version}
 
 def _save_job(jid: str, job_dict: dict) -> None:
     """
@@ -52,7 +268,10 @@ def _save_job(jid: str, job_dict: dict) -> None:
         jid (str): The job ID.
         job_dict (dict): The job object description.
     """
-    jdb.set(jid, json.dumps(job_dict))
+    pipe = rd.pipeline(transaction=False)
+    pipe.set(job_key(jid), json.dumps(job_dict))
+    pipe.sadd(JOB_INDEX, jid)
+    pipe.execute()
     logging.info(f"Job {jid} saved to Redis database")
     return
 
@@ -67,23 +286,33 @@ def _queue_job(jid: str) -> None:
     logging.info(f"Job {jid} added to the queue")
     return
 
-def add_job(bin_size: float, status: str = "submitted") -> dict:
+def add_job(bin_size: float, column: str = 'pl_rade', status: str = "submitted") -> dict:
     """
     Add a job to the redis queue.
     
     Args:
         start (int): The start value for the job.
         end (int): The end value for the job.
+        column (str): The column to plot (default: 'pl_rade').
         status (str): The status of the job (default: "submitted").
 
     Returns:
         dict: The job object description.
     """
     jid = _generate_jid()
-    job_dict = _instantiate_job(jid, status, float(bin_size))
-    _save_job(jid, job_dict)
-    _queue_job(jid)
-    logging.info(f"Job {jid} added with bin_size={bin_size}, status={status}")
+    bin_size = float(bin_size)
+    # Pin the active catalog so the job reads the version it was submitted against,
+    # even if the catalog is reloaded before it runs; the worker releases the pin
+    version = pin_catalog_version(ttl=JOB_PIN_TTL)
+    job_dict = _instantiate_job(jid, status, bin_size, column, version)
+    try:
+        _save_job(jid, job_dict)
+        _queue_job(jid)
+    except Exception:
+        if version:
+            unpin_catalog_version(version)
+        raise
+    logging.info(f"Job {jid} added with bin_size={bin_size}, column={column}, status={status}")
     return job_dict
 
 def get_job_by_id(jid: str) -> dict:
@@ -96,7 +325,7 @@ def get_job_by_id(jid: str) -> dict:
     Returns:
         dict: The job object description.
     """
-    return json.loads(jdb.get(jid))
+    return json.loads(rd.get(job_key(jid)))
 
 def update_job_status(jid: str, status: str) -> None:
     """
@@ -114,3 +343,274 @@ def update_job_status(jid: str, status: str) -> None:
     else:
         logging.warning(f"Job {jid} not found in database")
         raise Exception()
+
+def new_catalog_version() -> str:
+    """
+    Generate an identifier for a new catalog version.
+
+    Returns:
+        str: The generated version.
+    """
+    return uuid.uuid4().hex
+
+def get_catalog_version() -> str:
+    """
+    Return the active catalog version.
+
+    Returns:
+        str: The active catalog version, or None if no catalog is loaded.
+    """
+    version = rd.get(CATALOG_VERSION)
+    return version.decode('utf-8') if version else None
+
+def stage_catalog_version(version: str) -> str:
+    """
+    Register a catalog version to be built in the staging area.
+
+    The staging lease lasts STAGING_TTL seconds and is renewed by every `save_planets`;
+    a version whose builder stops renewing it is reclaimed.
+
+    Args:
+        version (str): The catalog version.
+
+    Returns:
+        str: 'staged' if the version can now be built, 'ready' if it is already fully
+             built and retained, or 'busy' if it is being built or reclaimed.
+    """
+    return _stage_script(keys=[CATALOG_STAGING, CATALOG_VERSIONS, CATALOG_RECLAIMING],
+                         args=[version, time.time() + STAGING_TTL]).decode('utf-8')
+
+def activate_catalog_version(version: str) -> bool:
+    """
+    Atomically make a fully built catalog version the one seen by all readers.
+
+    The previously active version is reclaimed in the background once it is no longer pinned.
+
+    Args:
+        version (str): The catalog version.
+
+    Returns:
+        bool: True if the version was activated, False if it no longer exists.
+    """
+    activated = bool(_activate_script(keys=[CATALOG_VERSION, CATALOG_STAGING, CATALOG_VERSIONS],
+                                      args=[version]))
+    if activated:
+        logging.info(f"Catalog version {version} activated")
+        reclaim_in_background()
+    return activated
+
+def discard_catalog_version(version: str) -> None:
+    """
+    Abandon a staged catalog version, e.g. after a failed load, so that it gets reclaimed.
+
+    Args:
+        version (str): The catalog version.
+    """
+    # Expire the staging lease; the reclaimer sweeps it like the lease of a crashed load
+    rd.zadd(CATALOG_STAGING, {version: 0}, xx=True)
+    logging.warning(f"Catalog version {version} discarded")
+    reclaim_in_background()
+
+def deactivate_catalog() -> None:
+    """
+    Unload the catalog. Readers immediately see an empty catalog and the data is
+    reclaimed in the background.
+    """
+    rd.delete(CATALOG_VERSION)
+    logging.info("Catalog deactivated")
+    reclaim_in_background()
+
+def pin_catalog_version(version: str = None, ttl: float = PIN_TTL) -> str:
+    """
+    Pin a catalog version so that it is not reclaimed while it is being read.
+
+    A pin that is never released expires after `ttl` seconds, so a crashed reader
+    cannot keep a version alive forever.
+
+    Args:
+        version (str): The catalog version to pin, or None to pin the active version.
+        ttl (float): The number of seconds the pin lasts at most.
+
+    Returns:
+        str: The pinned version, or None if the version does not exist.
+    """
+    pinned = _pin_script(keys=[CATALOG_VERSION, CATALOG_VERSIONS, CATALOG_PINS, CATALOG_PIN_DEADLINES],
+                         args=[version or '', time.time() + ttl])
+    return pinned.decode('utf-8') if pinned else None
+
+def unpin_catalog_version(version: str) -> None:
+    """
+    Release a pin taken with `pin_catalog_version`.
+
+    Args:
+        version (str): The pinned catalog version.
+    """
+    if _unpin_script(keys=[CATALOG_VERSION, CATALOG_PINS, CATALOG_PIN_DEADLINES], args=[version]):
+        reclaim_in_background()
+
+@contextlib.contextmanager
+def pinned_catalog_version(version: str = None):
+    """
+    Pin a catalog version for the duration of a `with` block.
+
+    Args:
+        version (str): The catalog version to pin, or None to pin the active version.
+
+    Yields:
+        str: The pinned version, or None if the version does not exist.
+    """
+    version = pin_catalog_version(version)
+    try:
+        yield version
+    finally:
+        if version:
+            unpin_catalog_version(version)
+
+def reclaim_catalog_versions() -> list:
+    """
+    Delete every catalog version that is neither active, staged nor pinned.
+
+    Expired pins are dropped first. Versions whose staging lease ran out and versions a
+    crashed reclaimer left half deleted are reclaimed as well.
+
+    Returns:
+        list: The reclaimed versions.
+    """
+    now = time.time()
+    keys = [CATALOG_VERSION, CATALOG_VERSIONS, CATALOG_PINS, CATALOG_STAGING, CATALOG_PIN_DEADLINES,
+            CATALOG_RECLAIMING]
+    versions = [version.decode('utf-8') for version in _retire_script(keys=keys, args=[now, now + RECLAIM_TTL])]
+    for version in versions:
+        names = get_planet_names(version)
+        for start in range(0, len(names), CATALOG_BATCH_SIZE):
+            rd.unlink(*[catalog_key(name, version) for name in names[start:start + CATALOG_BATCH_SIZE]])
+        rd.unlink(catalog_index_key(version))
+        rd.zrem(CATALOG_RECLAIMING, version)
+        logging.info(f"Reclaimed catalog version {version} ({len(names)} exoplanets)")
+    return versions
+
+def reclaim_in_background() -> None:
+    """
+    Reclaim unused catalog versions in a background thread.
+    """
+    threading.Thread(target=reclaim_catalog_versions, daemon=True).start()
+
+def reclaim_periodically(interval: float = RECLAIM_INTERVAL) -> None:
+    """
+    Sweep expired leases and reclaim unused catalog versions every `interval` seconds
+    in a background thread, so leaks are cleaned up even when nothing else changes.
+
+    Args:
+        interval (float): The number of seconds between sweeps.
+    """
+    def sweep():
+        while True:
+            time.sleep(interval)
+            try:
+                reclaim_catalog_versions()
+            except Exception as e:
+                logging.error(f"Error reclaiming catalog versions: {e}")
+
+    threading.Thread(target=sweep, daemon=True).start()
+
+def get_job_ids() -> list:
+    """
+    Return the IDs of all submitted jobs.
+
+    Returns:
+        list: The job IDs.
+    """
+    return [jid.decode('utf-8') for jid in rd.smembers(JOB_INDEX)]
+
+def save_result(jid: str, data: bytes) -> None:
+    """
+    Store the result of a job.
+
+    Args:
+        jid (str): The job ID.
+        data (bytes): The result data.
+    """
+    rd.set(result_key(jid), data)
+
+def get_result(jid: str) -> bytes:
+    """
+    Return the result of a job.
+
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        bytes: The result data, or None if there is no result.
+    """
+    return rd.get(result_key(jid))
+
+def save_planets(planets: list, version: str) -> None:
+    """
+    Store exoplanet records in a catalog version and add them to its index.
+
+    Args:
+        planets (list): The exoplanet records; each must have a 'pl_name'.
+        version (str): The staged catalog version.
+
+    Raises:
+        RuntimeError: If the staging lease of the version has run out.
+    """
+    # Renew the staging lease first, so a builder that outlived it stops writing
+    if not rd.zadd(CATALOG_STAGING, {version: time.time() + STAGING_TTL}, xx=True, ch=True):
+        raise RuntimeError(f"Catalog version {version} is no longer staged")
+    pipe = rd.pipeline(transaction=False)
+    for planet in planets:
+        pipe.set(catalog_key(planet['pl_name'], version), json.dumps(planet))
+    if planets:
+        pipe.sadd(catalog_index_key(version), *[planet['pl_name'] for planet in planets])
+    pipe.execute()
+
+def get_planet(pl_name: str, version: str = None) -> dict:
+    """
+    Return one exoplanet record from the catalog.
+
+    Args:
+        pl_name (str): The name of the exoplanet.
+        version (str): The catalog version, or None for the active version.
+
+    Returns:
+        dict: The exoplanet record, or None if it is not in the catalog.
+    """
+    with pinned_catalog_version(version) as version:
+        planet_json = rd.get(catalog_key(pl_name, version)) if version else None
+    return json.loads(planet_json) if planet_json else None
+
+def get_planet_names(version: str) -> list:
+    """
+    Return the names of all exoplanets in a catalog version.
+
+    Args:
+        version (str): The catalog version.
+
+    Returns:
+        list: The exoplanet names.
+    """
+    return [name.decode('utf-8') for name in rd.smembers(catalog_index_key(version))]
+
+def iter_planets(version: str = None):
+    """
+    Walk the index of one catalog version and read the exoplanet records in batches.
+
+    The version is pinned until the iteration finishes, so a concurrent reload never
+    mixes records from two versions.
+
+    Args:
+        version (str): The catalog version, or None for the active version.
+
+    Yields:
+        dict: One exoplanet record per planet in the catalog.
+    """
+    with pinned_catalog_version(version) as version:
+        if not version:
+            return
+        names = get_planet_names(version)
+        for start in range(0, len(names), CATALOG_BATCH_SIZE):
+            keys = [catalog_key(name, version) for name in names[start:start + CATALOG_BATCH_SIZE]]
+            for planet_json in rd.mget(keys):
+                if planet_json:
+                    yield json.loads(planet_json)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Migrate data from the legacy numbered-database layout to the namespaced key layout.
+
+Legacy layout (single Redis node):
+    db 0: exoplanet records under their bare planet names
+    db 1: the HotQueue job queue ('hotqueue:queue', pickled job IDs)
+    db 2: job descriptions under their job IDs
+    db 3: job results under their job IDs
+    db 4: the catalog version ('catalog_version')
+
+Usage:
+    python3 src/migrate.py [--delete-old]
+"""
+import argparse
+import json
+import logging
+import pickle
+import redis
+from derived import add_derived_columns
+from jobs import (CATALOG_BATCH_SIZE, JOB_INDEX, QUEUE_KEY, activate_catalog_version, discard_catalog_version,
+                  job_key, new_catalog_version, rd, redis_host, redis_port, result_key, save_planets,
+                  stage_catalog_version)
+
+LEGACY_QUEUE_KEY = 'hotqueue:queue'
+
+def _legacy(db: int) -> redis.Redis:
+    """
+    Connect to one of the legacy numbered databases.
+
+    Args:
+        db (int): The database number.
+
+    Returns:
+        redis.Redis: The client.
+    """
+    return redis.Redis(host=redis_host, port=redis_port, db=db)
+
+def migrate_catalog(delete_old: bool) -> int:
+    """
+    Copy the exoplanet records from db 0 into a new catalog version, with the derived
+    columns computed for every exoplanet, and activate it.
+
+    The version recorded in db 4 is kept, so an existing snapshot of the catalog still matches.
+    If there is nothing to copy, e.g. on a second run, the active catalog is left untouched.
+
+    Args:
+        delete_old (bool): Whether to delete the legacy keys once copied.
+
+    Returns:
+        int: The number of exoplanets migrated.
+    """
+    source = _legacy(0)
+    legacy_version = _legacy(4).get('catalog_version')
+    version = legacy_version.decode('utf-8') if legacy_version else new_catalog_version()
+    if stage_catalog_version(version) != 'staged':
+        version = new_catalog_version()
+        stage_catalog_version(version)
+    count = 0
+    batch = []
+    legacy_keys = []
+    for key in source.scan_iter(count=CATALOG_BATCH_SIZE):
+        # Namespaced keys share db 0 with the legacy keys on a single node
+        if key.startswith(b'{'):
+            continue
+        try:
+            planet = json.loads(source.get(key))
+        except (TypeError, ValueError, redis.ResponseError):
+            logging.warning(f"Skipping non-exoplanet key {key!r}")
+            continue
+        if not isinstance(planet, dict) or not planet.get('pl_name'):
+            logging.warning(f"Skipping non-exoplanet key {key!r}")
+            continue
+        batch.append(planet)
+        legacy_keys.append(key)
+        if len(batch) >= CATALOG_BATCH_SIZE:
+            save_planets(add_derived_columns(batch), version)
+            count += len(batch)
+            batch = []
+    save_planets(add_derived_columns(batch), version)
+    count += len(batch)
+    if count:
+        activate_catalog_version(version)
+    else:
+        discard_catalog_version(version)
+        logging.warning("No legacy exoplanets found, keeping the current catalog")
+
+    if delete_old:
+        for start in range(0, len(legacy_keys), CATALOG_BATCH_SIZE):
+            source.unlink(*legacy_keys[start:start + CATALOG_BATCH_SIZE])
+        _legacy(4).delete('catalog_version')
+    logging.info(f"Migrated {count} exoplanets into catalog version {version}")
+    return count
+
+def migrate_queue(delete_old: bool) -> int:
+    """
+    Move the pending job IDs from the HotQueue list in db 1 onto the job queue.
+
+    Args:
+        delete_old (bool): Whether to delete the legacy queue once copied.
+
+    Returns:
+        int: The number of queued jobs migrated.
+    """
+    source = _legacy(1)
+    # The legacy queue only ever held job IDs pickled by this application
+    jids = [pickle.loads(item) for item in source.lrange(LEGACY_QUEUE_KEY, 0, -1)]
+    if jids:
+        rd.rpush(QUEUE_KEY, *jids)
+    if delete_old:
+        source.delete(LEGACY_QUEUE_KEY)
+    logging.info(f"Migrated {len(jids)} queued jobs")
+    return len(jids)
+
+def migrate_jobs(delete_old: bool) -> int:
+    """
+    Copy the job descriptions from db 2 and the job results from db 3.
+
+    Args:
+        delete_old (bool): Whether to flush the legacy databases once copied.
+
+    Returns:
+        int: The number of jobs migrated.
+    """
+    jobs_source = _legacy(2)
+    results_source = _legacy(3)
+    count = 0
+    for key in jobs_source.scan_iter():
+        jid = key.decode('utf-8')
+        pipe = rd.pipeline(transaction=False)
+        pipe.set(job_key(jid), jobs_source.get(key))
+        pipe.sadd(JOB_INDEX, jid)
+        pipe.execute()
+        count += 1
+    for key in results_source.scan_iter():
+        rd.set(result_key(key.decode('utf-8')), results_source.get(key))
+    if delete_old:
+        jobs_source.flushdb(asynchronous=True)
+        results_source.flushdb(asynchronous=True)
+    logging.info(f"Migrated {count} jobs")
+    return count
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migrate Redis data from numbered databases to namespaced keys.")
+    parser.add_argument('--delete-old', action='store_true',
+                        help="delete the legacy keys and databases after copying them")
+    args = parser.parse_args()
+
+    migrate_catalog(args.delete_old)
+    migrate_queue(args.delete_old)
+    migrate_jobs(args.delete_old)
+    logging.warning("Migration complete")
+
+if __name__ == "__main__":
+    main()
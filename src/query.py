@@ -0,0 +1,456 @@
+import functools
+import json
+import logging
+import os
+import re
+import numpy as np
+
+# Configure logging
+log_level = os.environ.get('LOG_LEVEL', 'WARNING')
+logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+      | (?P<op><=|>=|!=|<>|=|<|>)
+      | (?P<paren>[(),])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+_KEYWORDS = {'AND', 'OR', 'NOT', 'IS', 'NULL', 'IN', 'TRUE', 'FALSE'}
+_COMPARISONS = {
+    '=': np.equal, '!=': np.not_equal, '<>': np.not_equal,
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+}
+
+class Column:
+    """
+    One catalog column held as an array, with a separate null mask.
+
+    Numeric columns are float64 with NaN for nulls. Text columns are object arrays with
+    nulls replaced by empty strings, so comparisons never see None.
+    """
+
+    def __init__(self, values: np.ndarray, nulls: np.ndarray, numeric: bool):
+        """
+        Args:
+            values (np.ndarray): The column values.
+            nulls (np.ndarray): A boolean array that is True where the value is missing.
+            numeric (bool): Whether the column is numeric.
+        """
+        self.values = values
+        self.nulls = nulls
+        self.numeric = numeric
+
+def _column_from_values(values: list) -> Column:
+    """
+    Build a column from a list of Python values.
+
+    Args:
+        values (list): The values, with None for missing entries.
+
+    Returns:
+        Column: The column.
+    """
+    nulls = np.array([value is None for value in values], dtype=bool)
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, (int, float)) for value in present):
+        numeric = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        return Column(numeric, nulls, True)
+    text = np.empty(len(values), dtype=object)
+    text[:] = ['' if value is None else str(value) for value in values]
+    return Column(text, nulls, False)
+
+def table_from_records(records: list) -> dict:
+    """
+    Build a columnar table from exoplanet records.
+
+    Args:
+        records (list): The exoplanet records.
+
+    Returns:
+        dict: Column name to Column.
+    """
+    names = {}
+    for record in records:
+        names.update(dict.fromkeys(record))
+    return {name: _column_from_values([record.get(name) for record in records]) for name in names}
+
+def table_from_snapshot(snapshot) -> dict:
+    """
+    Build a columnar table from a memory-mapped snapshot. Numeric columns are used in place.
+
+    Args:
+        snapshot (Snapshot): The snapshot.
+
+    Returns:
+        dict: Column name to Column.
+    """
+    table = {}
+    for name, column in snapshot.columns.items():
+        if column['kind'] in ('f8', 'i8', 'b1'):
+            values = snapshot.values(name)
+            table[name] = Column(values, np.isnan(values), True)
+        elif column['kind'] == 'str':
+            table[name] = _column_from_values(snapshot.strings(name))
+        else:
+            table[name] = _column_from_values([json.loads(value) if value is not None else None
+                                               for value in snapshot.strings(name)])
+    return table
+
+def _tokenize(text: str) -> list:
+    """
+    Split an expression into tokens.
+
+    Args:
+        text (str): The expression.
+
+    Returns:
+        list: (kind, value) tuples.
+
+    Raises:
+        ValueError: If the expression contains an unexpected character.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"Unexpected character at position {position}: {text[position]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            value = float(value)
+        elif kind == 'string':
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        elif kind == 'word' and value.upper() in _KEYWORDS:
+            kind, value = 'keyword', value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+class _Parser:
+    """
+    A recursive-descent parser for filter expressions.
+
+    Grammar:
+        expression := term (OR term)*
+        term       := factor (AND factor)*
+        factor     := NOT factor | '(' expression ')' | predicate
+        predicate  := operand IS [NOT] NULL
+                    | operand [NOT] IN '(' literal (',' literal)* ')'
+                    | operand comparison operand
+        operand    := column | number | string | TRUE | FALSE
+    """
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError("Unexpected end of expression")
+        self.position += 1
+        return token
+
+    def _accept(self, kind: str, value=None) -> bool:
+        token = self._peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value=None):
+        if not self._accept(kind, value):
+            found = self._peek()[1]
+            raise ValueError(f"Expected {value or kind} but found {'end of expression' if found is None else repr(found)}")
+
+    def parse(self) -> tuple:
+        node = self._expression()
+        if self._peek()[0] is not None:
+            raise ValueError(f"Unexpected {self._peek()[1]!r}")
+        return node
+
+    def _expression(self) -> tuple:
+        node = self._term()
+        while self._accept('keyword', 'OR'):
+            node = ('or', node, self._term())
+        return node
+
+    def _term(self) -> tuple:
+        node = self._factor()
+        while self._accept('keyword', 'AND'):
+            node = ('and', node, self._factor())
+        return node
+
+    def _factor(self) -> tuple:
+        if self._accept('keyword', 'NOT'):
+            return ('not', self._factor())
+        if self._accept('paren', '('):
+            node = self._expression()
+            self._expect('paren', ')')
+            return node
+        return self._predicate()
+
+    def _operand(self) -> tuple:
+        kind, value = self._next()
+        if kind == 'word':
+            return ('column', value)
+        if kind in ('number', 'string'):
+            return ('literal', value)
+        if kind == 'keyword' and value in ('TRUE', 'FALSE'):
+            return ('literal', 1.0 if value == 'TRUE' else 0.0)
+        raise ValueError(f"Expected a column or a value but found {value!r}")
+
+    def _predicate(self) -> tuple:
+        left = self._operand()
+        if self._accept('keyword', 'IS'):
+            negate = self._accept('keyword', 'NOT')
+            self._expect('keyword', 'NULL')
+            node = ('is_null', left)
+            return ('not', node) if negate else node
+        negate = self._accept('keyword', 'NOT')
+        if self._accept('keyword', 'IN'):
+            self._expect('paren', '(')
+            values = [self._operand()]
+            while self._accept('paren', ','):
+                values.append(self._operand())
+            self._expect('paren', ')')
+            if any(value[0] != 'literal' for value in values):
+                raise ValueError("IN only accepts literal values")
+            node = ('in', left, tuple(value[1] for value in values))
+            return ('not', node) if negate else node
+        if negate:
+            raise ValueError("Expected IN after NOT")
+        kind, op = self._next()
+        if kind != 'op':
+            raise ValueError(f"Expected a comparison operator but found {op!r}")
+        return ('compare', op, left, self._operand())
+
+@functools.lru_cache(maxsize=256)
+def parse_expression(text: str) -> tuple:
+    """
+    Parse a filter expression into a syntax tree. Results are cached by expression text.
+
+    Args:
+        text (str): The expression, e.g. "pl_orbper < 10 AND st_teff > 5000".
+
+    Returns:
+        tuple: The syntax tree.
+
+    Raises:
+        ValueError: If the expression is invalid.
+    """
+    tokens = _tokenize(text)
+    if not tokens:
+        raise ValueError("Empty expression")
+    return _Parser(tokens).parse()
+
+def _evaluate_operand(node: tuple, table: dict, rows: int) -> Column:
+    """
+    Evaluate an operand into a column.
+
+    Args:
+        node (tuple): A column or literal node.
+        table (dict): Column name to Column.
+        rows (int): The number of rows in the table.
+
+    Returns:
+        Column: The operand values.
+    """
+    if node[0] == 'column':
+        if node[1] not in table:
+            raise ValueError(f"Unknown column: {node[1]}")
+        return table[node[1]]
+    value = node[1]
+    numeric = isinstance(value, float)
+    values = np.full(rows, value, dtype=np.float64 if numeric else object)
+    return Column(values, np.zeros(rows, dtype=bool), numeric)
+
+def _evaluate(node: tuple, table: dict, rows: int) -> tuple:
+    """
+    Evaluate a syntax tree with three-valued (SQL) logic.
+
+    Args:
+        node (tuple): The syntax tree.
+        table (dict): Column name to Column.
+        rows (int): The number of rows in the table.
+
+    Returns:
+        tuple: Boolean arrays (true, false); rows in neither are unknown (null).
+    """
+    kind = node[0]
+    if kind == 'and':
+        left_true, left_false = _evaluate(node[1], table, rows)
+        right_true, right_false = _evaluate(node[2], table, rows)
+        return left_true & right_true, left_false | right_false
+    if kind == 'or':
+        left_true, left_false = _evaluate(node[1], table, rows)
+        right_true, right_false = _evaluate(node[2], table, rows)
+        return left_true | right_true, left_false & right_false
+    if kind == 'not':
+        true, false = _evaluate(node[1], table, rows)
+        return false, true
+    if kind == 'is_null':
+        nulls = _evaluate_operand(node[1], table, rows).nulls
+        return nulls, ~nulls
+    if kind == 'in':
+        column = _evaluate_operand(node[1], table, rows)
+        if any(isinstance(value, float) != column.numeric for value in node[2]):
+            raise ValueError(f"IN values must match the type of {node[1][1]}")
+        known = ~column.nulls
+        matches = np.isin(column.values, np.array(node[2], dtype=column.values.dtype))
+        return matches & known, ~matches & known
+    if kind == 'compare':
+        left = _evaluate_operand(node[2], table, rows)
+        right = _evaluate_operand(node[3], table, rows)
+        if left.numeric != right.numeric:
+            raise ValueError(f"Cannot compare a number with text in {node[1]!r} comparison")
+        known = ~(left.nulls | right.nulls)
+        result = _COMPARISONS[node[1]](left.values, right.values).astype(bool)
+        return result & known, ~result & known
+    raise ValueError(f"Unsupported expression: {kind}")
+
+def comparison(column: str, op: str, value) -> tuple:
+    """
+    Build the syntax tree of a single comparison between a column and a value.
+
+    Args:
+        column (str): The column name.
+        op (str): The comparison operator.
+        value: The value, a number or a string.
+
+    Returns:
+        tuple: The syntax tree.
+    """
+    return ('compare', op, ('column', column), ('literal', float(value) if isinstance(value, (int, float)) else value))
+
+def all_of(*trees) -> tuple:
+    """
+    Combine syntax trees with AND.
+
+    Args:
+        *trees (tuple): The syntax trees.
+
+    Returns:
+        tuple: The combined syntax tree, or None if no trees were given.
+    """
+    combined = None
+    for tree in trees:
+        combined = tree if combined is None else ('and', combined, tree)
+    return combined
+
+def filter_rows(tree: tuple, table: dict, rows: int) -> np.ndarray:
+    """
+    Return the indices of the rows for which an expression is true.
+
+    Args:
+        tree (tuple): The syntax tree from `parse_expression`, or None to match every row.
+        table (dict): Column name to Column.
+        rows (int): The number of rows in the table.
+
+    Returns:
+        np.ndarray: The matching row indices, in table order.
+
+    Raises:
+        ValueError: If the expression references unknown columns or mixes types.
+    """
+    if tree is None:
+        return np.arange(rows)
+    true, _ = _evaluate(tree, table, rows)
+    return np.flatnonzero(true)
+
+@functools.lru_cache(maxsize=256)
+def parse_order(text: str) -> tuple:
+    """
+    Parse an ORDER BY clause such as "pl_rade DESC, pl_name". Results are cached by text.
+
+    Args:
+        text (str): The clause.
+
+    Returns:
+        tuple: (column, descending) pairs.
+
+    Raises:
+        ValueError: If the clause is invalid.
+    """
+    keys = []
+    for part in text.split(','):
+        words = part.split()
+        if not words or len(words) > 2 or (len(words) == 2 and words[1].upper() not in ('ASC', 'DESC')):
+            raise ValueError(f"Invalid order_by clause: {part.strip()!r}")
+        keys.append((words[0], len(words) == 2 and words[1].upper() == 'DESC'))
+    return tuple(keys)
+
+def _sort_key(column: Column, indices: np.ndarray, descending: bool) -> np.ndarray:
+    """
+    Turn the selected rows of a column into a float64 sort key, with NaN for nulls so
+    they always sort last.
+
+    Args:
+        column (Column): The column.
+        indices (np.ndarray): The selected row indices.
+        descending (bool): Whether to sort in descending order.
+
+    Returns:
+        np.ndarray: The sort key.
+    """
+    if column.numeric:
+        key = column.values[indices].astype(np.float64)
+    else:
+        _, ranks = np.unique(column.values[indices], return_inverse=True)
+        key = ranks.astype(np.float64)
+    if descending:
+        key = -key
+    key[column.nulls[indices]] = np.nan
+    return key
+
+def order_rows(indices: np.ndarray, order_by: str, table: dict, limit: int = None, offset: int = 0) -> np.ndarray:
+    """
+    Sort row indices and apply an offset and limit.
+
+    Ties keep the order of `indices`, so pages of the same query never overlap. With a
+    single sort column and a limit, only the rows up to the `offset + limit`-th key
+    (including every row tied with it) are selected and sorted, instead of sorting every row.
+
+    Args:
+        indices (np.ndarray): The row indices to order.
+        order_by (str): The ORDER BY clause, or None to keep table order.
+        table (dict): Column name to Column.
+        limit (int): The maximum number of rows to return, or None for all.
+        offset (int): The number of rows to skip.
+
+    Returns:
+        np.ndarray: The selected row indices, in order.
+
+    Raises:
+        ValueError: If the clause references unknown columns.
+    """
+    end = None if limit is None else offset + limit
+    if order_by:
+        keys = parse_order(order_by)
+        for name, _ in keys:
+            if name not in table:
+                raise ValueError(f"Unknown column: {name}")
+        sort_keys = [_sort_key(table[name], indices, descending) for name, descending in keys]
+        key = sort_keys[0]
+        limited = len(sort_keys) == 1 and end is not None and end < len(indices)
+        kth = np.partition(key, end - 1)[end - 1] if limited and end > 0 else np.nan
+        if limited and end == 0:
+            order = np.array([], dtype=np.intp)
+        elif limited and not np.isnan(kth):
+            # Every row tied with the last selected key is kept, in table order, so the
+            # stable sort below orders ties exactly like the full sort
+            top = np.flatnonzero(key <= kth)
+            order = top[np.argsort(key[top], kind='stable')]
+        else:
+            # np.lexsort sorts by the last key first; NaN (null) sorts last
+            order = np.lexsort(sort_keys[::-1])
+        indices = indices[order]
+    return indices[offset:end]
@@ -0,0 +1,500 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+import numpy as np
+
+# Configure logging
+log_level = os.environ.get('LOG_LEVEL', 'WARNING')
+logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', 'data/catalog.snap')
+MAGIC = b'EXOSNAP\x00'
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+# Maximum number of rows encoded at a time when writing a snapshot
+_SEGMENT_ROWS = 1000
+
+# Process-wide mapping of the snapshot file, shared by every request/job in this process
+_current = None
+
+def _pad(length: int) -> int:
+    """
+    Return the number of padding bytes needed to align `length` to the column alignment.
+
+    Args:
+        length (int): The current length in bytes.
+
+    Returns:
+        int: The number of padding bytes.
+    """
+    return -length % _ALIGN
+
+def _column_kind(values: list) -> str:
+    """
+    Choose the on-disk encoding for a column from its non-null values.
+
+    Args:
+        values (list): The column values, with None for missing entries.
+
+    Returns:
+        str: One of 'b1', 'i8', 'f8', 'str' or 'json'.
+    """
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, str) for value in present):
+        return 'str'
+    if all(isinstance(value, bool) for value in present):
+        return 'b1'
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return 'i8'
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return 'f8'
+    return 'json'
+
+def _merge_kinds(kinds: set) -> str:
+    """
+    Choose the on-disk encoding for a column from the encodings of its chunks.
+
+    Args:
+        kinds (set): The kinds of the chunks holding at least one value.
+
+    Returns:
+        str: The kind `_column_kind` would choose for the whole column.
+    """
+    if not kinds:
+        return 'str'
+    if len(kinds) == 1:
+        return next(iter(kinds))
+    if kinds <= {'i8', 'f8'}:
+        return 'f8'
+    return 'json'
+
+class SnapshotWriter:
+    """
+    Spool catalog records chunk by chunk and persist them as a column-oriented snapshot file.
+
+    The file starts with a fixed preamble (magic, format version, header length), followed by
+    a JSON header describing every column, followed by the 8-byte aligned column buffers. Each
+    column has a validity mask and either a fixed-width numeric array or an offsets array plus
+    a UTF-8 blob. The file is written next to its destination and renamed into place, so
+    processes that already mapped the previous snapshot keep reading a consistent file.
+
+    Each added chunk is appended to one spool file per column, and the column buffers are
+    encoded a chunk at a time at commit, so memory use is bounded by the chunk size rather
+    than by the size of the catalog.
+    """
+
+    def __init__(self, version: str, path: str = SNAPSHOT_PATH):
+        """
+        Args:
+            version (str): The catalog version stored in the snapshot header.
+            path (str): The destination path of the snapshot file.
+        """
+        self.version = version
+        self.path = path
+        self.rows = 0
+        self._spool_dir = None
+        self._spools = {}
+        self._kinds = {}
+
+    def _spool(self, name: str):
+        """
+        Return the spool file of a column, creating it on first use.
+
+        A column first seen after some rows were added starts with a run of missing values.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            file: The spool file, open for appending.
+        """
+        if name not in self._spools:
+            if self._spool_dir is None:
+                directory = os.path.dirname(self.path) or '.'
+                os.makedirs(directory, exist_ok=True)
+                self._spool_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(self.path)}.spool-", dir=directory)
+            spool = open(os.path.join(self._spool_dir, f"{len(self._spools)}.jsonl"), 'w+', encoding='utf-8')
+            if self.rows:
+                spool.write(f"{self.rows}\n")
+            self._spools[name] = spool
+            self._kinds[name] = set()
+        return self._spools[name]
+
+    def add_chunk(self, records: list) -> None:
+        """
+        Append a chunk of catalog records to the snapshot.
+
+        Args:
+            records (list): The exoplanet records.
+        """
+        if not records:
+            return
+        for record in records:
+            for name in record:
+                self._spool(name)
+        for name, spool in self._spools.items():
+            values = [record.get(name) for record in records]
+            if any(value is not None for value in values):
+                self._kinds[name].add(_column_kind(values))
+                spool.write(json.dumps(values) + '\n')
+            else:
+                spool.write(f"{len(values)}\n")
+        self.rows += len(records)
+
+    def _segments(self, name: str):
+        """
+        Read back the spooled values of a column, one chunk at a time.
+
+        Args:
+            name (str): The column name.
+
+        Yields:
+            list: The next chunk of values, with None for missing entries.
+        """
+        spool = self._spools[name]
+        spool.seek(0)
+        for line in spool:
+            segment = json.loads(line)
+            if isinstance(segment, int):
+                for start in range(0, segment, _SEGMENT_ROWS):
+                    yield [None] * min(_SEGMENT_ROWS, segment - start)
+            else:
+                yield segment
+
+    def _write_column(self, name: str, out) -> dict:
+        """
+        Encode one column into the data section, one spooled chunk at a time.
+
+        Args:
+            name (str): The column name.
+            out (file): The data section, positioned at an 8-byte boundary.
+
+        Returns:
+            dict: The column description for the header.
+        """
+        kind = _merge_kinds(self._kinds[name])
+        column = {'name': name, 'kind': kind}
+
+        def write_buffer(buffer_name: str, encode) -> None:
+            start = out.tell()
+            for values in self._segments(name):
+                out.write(encode(values))
+            length = out.tell() - start
+            out.write(b'\x00' * _pad(length))
+            column[buffer_name] = [start, length]
+
+        def encoded(values: list) -> list:
+            if kind == 'json':
+                values = [json.dumps(value) if value is not None else None for value in values]
+            return [value.encode('utf-8') if value is not None else b'' for value in values]
+
+        write_buffer('mask', lambda values: np.array([value is not None for value in values],
+                                                     dtype=np.uint8).tobytes())
+        if kind == 'b1':
+            write_buffer('data', lambda values: np.array([bool(value) for value in values],
+                                                         dtype=np.uint8).tobytes())
+        elif kind in ('i8', 'f8'):
+            fill = 0 if kind == 'i8' else np.nan
+            write_buffer('data', lambda values: np.array([fill if value is None else value for value in values],
+                                                         dtype='<' + kind).tobytes())
+        else:
+            write_buffer('data', lambda values: b''.join(encoded(values)))
+            total = 0
+
+            def offsets(values: list) -> bytes:
+                nonlocal total
+                lengths = np.cumsum([len(value) for value in encoded(values)], dtype='<i8') + total
+                total = int(lengths[-1])
+                return lengths.tobytes()
+
+            # The leading zero offset is written ahead of the per-chunk end offsets
+            start = out.tell()
+            out.write(np.zeros(1, dtype='<i8').tobytes())
+            write_buffer('offsets', offsets)
+            column['offsets'] = [start, column['offsets'][1] + 8]
+        return column
+
+    def discard(self) -> None:
+        """
+        Delete the spooled chunks without writing a snapshot.
+        """
+        for spool in self._spools.values():
+            spool.close()
+        if self._spool_dir is not None:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+        self._spools = {}
+        self._spool_dir = None
+
+    def commit(self) -> str:
+        """
+        Write the snapshot to disk and atomically replace any previous snapshot.
+
+        Returns:
+            str: The path of the written snapshot.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Each commit gets its own temporary file, so concurrent writers in this or another
+        # process sharing the directory never write into each other's file
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=f".{os.path.basename(self.path)}.tmp-")
+        try:
+            # The column buffers are encoded into a scratch data section first, since the
+            # header that precedes them records their positions and lengths
+            with tempfile.TemporaryFile(dir=directory or '.') as data:
+                columns = [self._write_column(name, data) for name in self._spools]
+                header = json.dumps({
+                    'version': self.version,
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'rows': self.rows,
+                    'columns': columns,
+                }).encode('utf-8')
+                header += b' ' * _pad(_PREAMBLE.size + len(header))
+
+                data.seek(0)
+                with os.fdopen(fd, 'wb') as f:
+                    fd = None
+                    # mkstemp creates the file readable by its owner only; readers such as
+                    # the worker may run as another user
+                    os.fchmod(f.fileno(), 0o644)
+                    f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+                    f.write(header)
+                    shutil.copyfileobj(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self.discard()
+        logging.info(f"Snapshot {self.version} with {self.rows} rows written to {self.path}")
+        return self.path
+
+def write_snapshot(records, version: str, path: str = SNAPSHOT_PATH) -> str:
+    """
+    Persist an iterable of catalog records as a snapshot file.
+
+    Args:
+        records (iterable): The exoplanet records.
+        version (str): The catalog version stored in the snapshot header.
+        path (str): The destination path of the snapshot file.
+
+    Returns:
+        str: The path of the written snapshot.
+    """
+    writer = SnapshotWriter(version, path)
+    try:
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= _SEGMENT_ROWS:
+                writer.add_chunk(chunk)
+                chunk = []
+        writer.add_chunk(chunk)
+    except BaseException:
+        writer.discard()
+        raise
+    return writer.commit()
+
+class Snapshot:
+    """
+    A read-only, memory-mapped view of a snapshot file.
+
+    Numeric columns are returned as NumPy arrays backed directly by the mapping, so the pages
+    are loaded lazily and shared through the page cache by every process on the node.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        """
+        Args:
+            path (str): The path of the snapshot file.
+
+        Raises:
+            ValueError: If the file is not a snapshot or has an unsupported format version.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, format_version, header_length = _PREAMBLE.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a catalog snapshot")
+        if format_version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot format version {format_version}")
+        header = json.loads(self._mm[_PREAMBLE.size:_PREAMBLE.size + header_length])
+        self._data_start = _PREAMBLE.size + header_length
+        self.version = header['version']
+        self.created = header['created']
+        self.rows = header['rows']
+        self.columns = {column['name']: column for column in header['columns']}
+
+    def _buffer(self, column: dict, buffer_name: str, dtype: str) -> np.ndarray:
+        """
+        Return a zero-copy array over one of a column's buffers.
+
+        Args:
+            column (dict): The column description from the header.
+            buffer_name (str): The buffer to map ('mask', 'data' or 'offsets').
+            dtype (str): The NumPy dtype of the buffer.
+
+        Returns:
+            np.ndarray: A read-only array backed by the memory mapping.
+        """
+        offset, length = column[buffer_name]
+        return np.frombuffer(self._mm, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                             offset=self._data_start + offset)
+
+    def _column(self, name: str) -> dict:
+        """
+        Look up a column description by name.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            dict: The column description.
+
+        Raises:
+            KeyError: If the snapshot has no such column.
+        """
+        if name not in self.columns:
+            raise KeyError(f"Unknown column: {name}")
+        return self.columns[name]
+
+    def mask(self, name: str) -> np.ndarray:
+        """
+        Return the validity mask of a column.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            np.ndarray: A boolean array that is True where the value is present.
+        """
+        return self._buffer(self._column(name), 'mask', 'u1').astype(bool)
+
+    def values(self, name: str) -> np.ndarray:
+        """
+        Return a numeric column as float64, with NaN for missing values. Flags are 1.0 or 0.0.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            np.ndarray: The column values.
+
+        Raises:
+            TypeError: If the column is not numeric.
+        """
+        column = self._column(name)
+        if column['kind'] == 'f8':
+            return self._buffer(column, 'data', '<f8')
+        if column['kind'] in ('i8', 'b1'):
+            dtype = '<i8' if column['kind'] == 'i8' else 'u1'
+            values = self._buffer(column, 'data', dtype).astype(np.float64)
+            values[~self.mask(name)] = np.nan
+            return values
+        raise TypeError(f"Column {name} is not numeric")
+
+    def strings(self, name: str) -> list:
+        """
+        Decode a text column.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            list: The column values, with None for missing values.
+        """
+        column = self._column(name)
+        if column['kind'] not in ('str', 'json'):
+            raise TypeError(f"Column {name} is not a text column")
+        offsets = self._buffer(column, 'offsets', '<i8')
+        mask = self._buffer(column, 'mask', 'u1')
+        start = self._data_start + column['data'][0]
+        blob = self._mm[start:start + column['data'][1]]
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') if mask[i] else None
+                for i in range(self.rows)]
+
+    def _decoded(self, name: str) -> list:
+        """
+        Decode any column back into the Python values it was written from.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            list: The column values, with None for missing values.
+        """
+        kind = self.columns[name]['kind']
+        if kind == 'str':
+            return self.strings(name)
+        if kind == 'json':
+            return [json.loads(value) if value is not None else None for value in self.strings(name)]
+        if kind == 'b1':
+            data = self._buffer(self.columns[name], 'data', 'u1').astype(bool).tolist()
+        else:
+            data = self._buffer(self.columns[name], 'data', '<' + kind).tolist()
+        mask = self._buffer(self.columns[name], 'mask', 'u1').tolist()
+        return [value if present else None for value, present in zip(data, mask)]
+
+    def records(self):
+        """
+        Rebuild the catalog records stored in the snapshot.
+
+        Yields:
+            dict: One exoplanet record per row, with the original column order.
+        """
+        names = list(self.columns)
+        columns = [self._decoded(name) for name in names]
+        for row in zip(*columns):
+            yield dict(zip(names, row))
+
+    def close(self) -> None:
+        """
+        Release the memory mapping.
+        """
+        self._mm.close()
+
+def open_snapshot(path: str = SNAPSHOT_PATH):
+    """
+    Return the process-wide mapping of the snapshot, remapping it if the file was replaced.
+
+    Args:
+        path (str): The path of the snapshot file.
+
+    Returns:
+        Snapshot: The mapped snapshot, or None if no valid snapshot exists.
+    """
+    global _current
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _current is not None and _current.path == path and _current.identity == identity:
+        return _current
+    try:
+        # The previous mapping is left to the garbage collector, since arrays handed out
+        # to in-flight requests may still reference it
+        _current = Snapshot(path)
+        logging.info(f"Mapped snapshot {_current.version} ({_current.rows} rows) from {path}")
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Unable to map snapshot {path}: {e}")
+        _current = None
+    return _current
@@ -1,5 +1,6 @@
-from jobs import get_job_by_id, update_job_status, q, rd, rdb
-import json
+from jobs import get_job_by_id, iter_planets, save_result, unpin_catalog_version, update_job_status, q
+from snapshot import open_snapshot
+from derived import DERIVED_COLUMNS
 import logging
 import os
 import matplotlib.pyplot as plt
@@ -10,38 +11,90 @@ import numpy as np
 log_level = os.environ.get('LOG_LEVEL', 'WARNING')
 logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Axis labels and titles of the histograms of catalog columns
+HISTOGRAM_LABELS = {
+    'pl_rade': ('Planet Radius (Earth Radii)', 'Distribution of Planet Sizes'),
+}
+
+def get_column_values(version: str, column: str) -> list:
+    """
+    Return the known values of a numeric column for all planets in a catalog version.
+
+    The memory-mapped snapshot is used when it holds that version and column; otherwise
+    every planet is read back from Redis.
+
+    Args:
+        version (str): The catalog version.
+        column (str): The catalog or derived column.
+
+    Returns:
+        list: The column values, without missing values.
+    """
+    snapshot = open_snapshot()
+    if snapshot is not None and version and snapshot.version == version and column in snapshot.columns:
+        values = snapshot.values(column)
+        logging.debug(f"Reading {column} from snapshot {snapshot.version}")
+        return values[~np.isnan(values)].tolist()
+
+    values = []
+    for planet in iter_planets(version):
+        value = planet.get(column)
+        if value is not None:
+            values.append(float(value))
+    return values
+
+def get_labels(column: str) -> tuple:
+    """
+    Return the axis label and title of the histogram of a column.
+
+    Args:
+        column (str): The catalog or derived column.
+
+    Returns:
+        tuple: The x axis label and the plot title.
+    """
+    if column in HISTOGRAM_LABELS:
+        return HISTOGRAM_LABELS[column]
+    label = DERIVED_COLUMNS[column][2] if column in DERIVED_COLUMNS else column
+    return label, f"Distribution of {label}"
+
+# Map the on-disk snapshot up front so the first job is served warm
+open_snapshot()
+
 @q.worker
 def do_work(jobid: str) -> None:
     """
-    Plot the histogram of planet size distribution based on parameters from a given job ID.
+    Plot the histogram of a column, by default the planet size distribution, based on
+    parameters from a given job ID.
 
     Args:
         jobid (str): The ID of the job.
     """
+    version = None
     try:
         job = get_job_by_id(jobid)
+        # The catalog version was pinned when the job was submitted; the pin is released
+        # once the job is done, however it ends
+        version = job.get('version')
         bin_size = job['bin_size']
+        column = job.get('column', 'pl_rade')
         logging.info(f"Processing job {jobid}")
         update_job_status(jobid, "in progress")
 
-        # Retrieve planet data from Redis
-        planet_radii = []
-        for key in rd.keys():
-            planet_json = rd.get(key)
-            planet = json.loads(planet_json)
-            radius = planet.get('pl_rade')
-            if radius:
-                planet_radii.append(radius)
+        # Retrieve planet data for the pinned catalog version
+        values = get_column_values(version, column)
 
         # Create a new figure
         fig, ax = plt.subplots(figsize=(8, 6))
 
         # Plot the histogram
-        bins = np.arange(0, max(planet_radii) + bin_size, bin_size)
-        ax.hist(planet_radii, bins=bins, edgecolor='black')
-        ax.set_xlabel('Planet Radius (Earth Radii)')
+        start = min(0, np.floor(min(values) / bin_size) * bin_size)
+        bins = np.arange(start, max(values) + bin_size, bin_size)
+        xlabel, title = get_labels(column)
+        ax.hist(values, bins=bins, edgecolor='black')
+        ax.set_xlabel(xlabel)
         ax.set_ylabel('Count')
-        ax.set_title('Distribution of Planet Sizes')
+        ax.set_title(title)
 
         # Save the plot to a bytes buffer
         buffer = io.BytesIO()
@@ -49,7 +102,7 @@ def do_work(jobid: str) -> None:
         buffer.seek(0)
 
         # Store the plot data in the results database
-        rdb.set(jobid, buffer.getvalue())
+        save_result(jobid, buffer.getvalue())
 
         # Close the figure to free up memory
         plt.close(fig)
@@ -60,5 +113,8 @@ def do_work(jobid: str) -> None:
     except Exception as e:
         logging.error(f"Error processing job {jobid}: {e}")
         update_job_status(jobid, "failed")
+    finally:
+        if version:
+            unpin_catalog_version(version)
 
 do_work()
@@ -11,6 +11,12 @@ def test_load_data():
     assert data['status'] == 'success'
     assert data['message'] == 'Data loaded into Redis'
 
+def test_load_data_missing_file():
+    response = requests.post(f'{base_url}/data', params={'file': 'does-not-exist.csv'})
+    assert response.status_code == 404
+    data = response.json()
+    assert data['status'] == 'error'
+
 def test_get_data():
     response = requests.get(f'{base_url}/data')
     assert response.status_code == 200
@@ -27,6 +33,18 @@ def test_delete_data():
     # Load the data back for other tests
     requests.post(f'{base_url}/data')
 
+def test_restore_data():
+    requests.delete(f'{base_url}/data')
+    response = requests.post(f'{base_url}/data/restore')
+    assert response.status_code == 200
+    data = response.json()
+    assert data['status'] == 'success'
+    assert data['count'] > 0
+
+    response = requests.get(f'{base_url}/data')
+    assert response.status_code == 200
+    assert len(response.json()) == data['count']
+
 def test_get_exoplanets():
     response = requests.get(f'{base_url}/exoplanets')
     assert response.status_code == 200
@@ -70,6 +88,55 @@ def test_get_exoplanets_invalid_parameters():
     assert data['status'] == 'error'
     assert 'message' in data
 
+def test_get_exoplanets_where_order_limit():
+    query_params = {
+        'where': "pl_orbper < 10 AND st_teff > 5000",
+        'order_by': 'pl_rade DESC',
+        'limit': 5
+    }
+    response = requests.get(f'{base_url}/exoplanets', params=query_params)
+    assert response.status_code == 200
+    data = response.json()
+    assert isinstance(data, list)
+    assert len(data) <= 5
+
+    radii = [requests.get(f'{base_url}/exoplanets/{pl_name}').json()['pl_rade'] for pl_name in data]
+    known = [radius for radius in radii if radius is not None]
+    assert known == sorted(known, reverse=True)
+
+def test_get_exoplanets_pages_with_ties():
+    query_params = {'where': "disc_year IS NOT NULL", 'order_by': 'disc_year'}
+    response = requests.get(f'{base_url}/exoplanets', params=query_params)
+    assert response.status_code == 200
+    everything = response.json()
+
+    pages = []
+    for offset in range(0, 500, 50):
+        response = requests.get(f'{base_url}/exoplanets', params={**query_params, 'limit': 50, 'offset': offset})
+        assert response.status_code == 200
+        pages.extend(response.json())
+    assert pages == everything[:500]
+    assert len(set(pages)) == len(pages)
+
+def test_get_exoplanets_derived_columns():
+    query_params = {'where': "pl_in_hz = TRUE", 'order_by': 'pl_eqt_calc DESC', 'limit': 5}
+    response = requests.get(f'{base_url}/exoplanets', params=query_params)
+    assert response.status_code == 200
+    data = response.json()
+    assert isinstance(data, list)
+    assert len(data) <= 5
+
+    for pl_name in data:
+        exoplanet = requests.get(f'{base_url}/exoplanets/{pl_name}').json()
+        assert exoplanet['pl_in_hz'] is True
+        assert 'pl_insol_calc' in exoplanet
+
+def test_get_exoplanets_invalid_where():
+    response = requests.get(f'{base_url}/exoplanets', params={'where': 'pl_rade >'})
+    assert response.status_code == 400
+    data = response.json()
+    assert data['status'] == 'error'
+
 def test_get_specific_exoplanet_data():
     response = requests.get(f'{base_url}/exoplanets')
     pl_names = response.json()
@@ -119,6 +186,14 @@ def test_get_exoplanets_by_facility():
     else:
        pytest.skip("No data available for testing")
 
+def test_get_stats():
+    requests.get(f'{base_url}/hosts')
+    response = requests.get(f'{base_url}/stats')
+    assert response.status_code == 200
+    data = response.json()
+    assert isinstance(data, dict)
+    assert set(data['/hosts']) == {'admitted', 'coalesced', 'shed'}
+
 def test_help_route():
     response = requests.get(f'{base_url}/help')
     assert response.status_code == 200
@@ -12,6 +12,16 @@ def test_add_job():
     assert isinstance(data, dict)
     assert 'id' in data
     assert data['status'] == 'submitted'
+    assert 'version' in data
+
+def test_add_job_derived_column():
+    job_data = {'bin_size': 100, 'column': 'pl_eqt_calc'}
+    response = requests.post(f'{base_url}/jobs', json=job_data)
+    assert response.status_code == 200
+    assert response.json()['column'] == 'pl_eqt_calc'
+
+    response = requests.post(f'{base_url}/jobs', json={'column': 'hostname'})
+    assert response.status_code == 400
 
 def test_get_job_by_id():
     job_data = {'bin_size': 2.5}